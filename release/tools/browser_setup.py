@@ -10,76 +10,577 @@ Run this on a machine with internet access (for vendoring) and Python installed.
 
 import os
 import sys
-import shutil
+import argparse
+import json
+import gzip
+import hashlib
+import http.client
+import ssl
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from pathlib import Path
-from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
+from urllib.parse import urljoin, urlsplit
 
+# Concurrent CDN downloads; capped to stay clear of jsDelivr rate limits
+DOWNLOAD_WORKERS = 16
+REQUEST_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+# Bodies are streamed to disk in chunks of this size, never held whole
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+# OSError covers connection resets / timeouts while reading a body (and a
+# full disk); httpx.HTTPError is added by download_file when httpx is in use
+DOWNLOAD_ERRORS = (OSError, http.client.HTTPException)
+MAX_REDIRECTS = 5
+# ETag / Last-Modified of each vendored file, for conditional re-downloads
+VENDOR_CACHE_NAME = ".vendor-cache.json"
+# SHA-256 of each vendored file, checked by --verify
+MANIFEST_NAME = ".manifest.sha256"
+# Browsers may cache any file but must revalidate it (a cheap 304 over
+# loopback): vendored files can be replaced in place by --refresh/--verify
+SERVE_CACHE_CONTROL = 'no-cache'
+# Progress lines vendor_libs buffers before writing them out
+PROGRESS_BATCH = 16
+# Vendored bundles get a pre-compressed sibling the server can send as-is
+GZIP_SUFFIX = '.gz'
+# Below this size gzip saves too little to be worth a second file
+GZIP_MIN_SIZE = 1024
+# Web-root directories whose .js files get .gz siblings (see gzip_bundles)
+GZIP_DIRS = ('libs', 'npm')
 
-def download_file(url, dest):
-    """Download a file from a URL to a local path."""
+
+class DownloadError(Exception):
+    """A bundle could not be fetched or written; the message says which and why."""
+
+
+@lru_cache(maxsize=None)
+def ssl_context():
+    """
+    The one SSLContext used for every CDN connection.
+
+    Loading the CA store is the expensive part of setting up a context, so
+    it happens once rather than per connection.
+    """
+    return ssl.create_default_context()
+
+
+def make_http_client():
+    """
+    Create the httpx client shared by all downloads, or None without httpx.
+
+    Every bundle comes from the same host, so one client lets the downloads
+    reuse connections (multiplexed over HTTP/2 when the h2 extra is
+    installed) instead of paying a TCP + TLS handshake per file. httpx is
+    optional and imported only here, so runs that never download (online
+    mode, serving) don't pay for importing it.
+    """
+    try:
+        import httpx
+    except ImportError:
+        return None
+    options = dict(
+        headers=REQUEST_HEADERS,
+        timeout=30.0,
+        verify=ssl_context(),
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=DOWNLOAD_WORKERS,
+                            max_keepalive_connections=DOWNLOAD_WORKERS),
+    )
+    try:
+        return httpx.Client(http2=True, **options)
+    except ImportError:
+        # httpx without the h2 extra — still keep-alive over HTTP/1.1
+        return httpx.Client(**options)
+
+
+def _write_all(fd, data):
+    """os.write `data` to `fd` in full (os.write may write less than asked)."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _open_for_write(path):
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+
+
+def _write_atomic(path, chunks):
+    """
+    Write `chunks` to `path` via `path`.tmp and a rename.
+
+    `path` only ever holds a complete file: if any chunk fails (e.g. the
+    connection drops mid-body) the temporary file is removed and the old
+    `path`, if any, is left as it was.
+    """
+    tmp_path = f"{path}.tmp"
+    fd = _open_for_write(tmp_path)
+    try:
+        for chunk in chunks:
+            _write_all(fd, chunk)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    os.close(fd)
+    os.replace(tmp_path, path)
+
+
+def _write_body(dest, chunks, rewrite):
+    """
+    Write response body `chunks` to `dest`; returns True if imports were rewritten.
+
+    With `rewrite`, jsDelivr's '"./npm/' sub-module imports become '"../npm/'
+    (see vendor_libs) before the single write, so the bundle never needs a
+    second read-modify-write pass. The pattern can straddle chunk
+    boundaries, so such bodies are joined first; others are streamed.
+    Chunks go straight to os.write: they are already large, so a
+    BufferedWriter would only add a copy. Either way `dest` is replaced
+    atomically (see _write_atomic).
+    """
+    if not rewrite:
+        _write_atomic(dest, chunks)
+        return False
+    body = b"".join(chunks)
+    rewritten = body.replace(b'"./npm/', b'"../npm/')
+    _write_atomic(dest, [rewritten])
+    return rewritten != body
+
+
+# Without httpx, each download worker keeps its own keep-alive connection
+# per host, so only the first request on a thread pays for TCP + TLS.
+_thread_local = threading.local()
+
+
+def _thread_connection(scheme, netloc):
+    connections = _thread_local.__dict__.setdefault('connections', {})
+    conn = connections.get((scheme, netloc))
+    if conn is None:
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=30, context=ssl_context())
+        elif scheme == 'http':
+            conn = http.client.HTTPConnection(netloc, timeout=30)
+        else:
+            raise URLError(f"unsupported URL scheme {scheme!r}")
+        connections[(scheme, netloc)] = conn
+    return conn
+
+
+def _drop_thread_connection(scheme, netloc):
+    conn = _thread_local.__dict__.get('connections', {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _thread_request(url, headers):
+    """Send a GET for `url` on this thread's connection; returns the response."""
+    parts = urlsplit(url)
+    target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    for attempt in range(2):
+        conn = _thread_connection(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', target, headers=headers)
+            return conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+            # The server closed the idle keep-alive connection: reconnect once
+            _drop_thread_connection(parts.scheme, parts.netloc)
+            if attempt:
+                raise URLError(e)
+        except OSError as e:
+            _drop_thread_connection(parts.scheme, parts.netloc)
+            raise URLError(e)
+
+
+@contextmanager
+def _pooled_get(url, headers):
+    """
+    urlopen() stand-in that reuses the calling thread's connection.
+
+    Follows redirects and raises HTTPError for other non-2xx statuses
+    (including 304), like urlopen. A response abandoned mid-body takes
+    its connection with it, since the stream can no longer be reused.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        resp = _thread_request(url, headers)
+        parts = urlsplit(url)
+        location = resp.getheader('Location')
+        if resp.status in (301, 302, 303, 307, 308) and location:
+            resp.read()
+            url = urljoin(url, location)
+            continue
+        if resp.status >= 300:
+            resp.read()
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        try:
+            yield resp
+        finally:
+            if not resp.isclosed():
+                _drop_thread_connection(parts.scheme, parts.netloc)
+        return
+    raise URLError(f"too many redirects for {url}")
+
+
+def _response_validators(headers, previous=None, not_modified=False, rewritten=False):
+    """Build download_file's result from response headers (falling back to `previous`)."""
+    previous = previous or {}
+    return {
+        'etag': headers.get('ETag') or previous.get('etag'),
+        'last_modified': headers.get('Last-Modified') or previous.get('last_modified'),
+        'not_modified': not_modified,
+        'rewritten': rewritten,
+    }
+
+
+def download_file(url, dest, client=None, validators=None, rewrite=False):
+    """Download a file from a URL to a local path.
+
+    Uses `client` (from make_http_client) when given, otherwise the
+    calling thread's keep-alive connection (see _pooled_get).
+    `validators` ({'etag', 'last_modified'} from an earlier download) make
+    the request conditional when `dest` exists; on a 304 the file is left
+    untouched. `rewrite` fixes up sub-module import paths (see _write_body).
+
+    Returns a dict with the response's `etag`, `last_modified`, whether it
+    was `not_modified` and whether imports were `rewritten`. Raises
+    DownloadError on failure; nothing is printed, since this runs on the
+    download worker threads.
+    """
     dest = Path(dest)
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    headers = dict(REQUEST_HEADERS)
+    if validators and dest.exists():
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    errors = DOWNLOAD_ERRORS
+    if client is not None:
+        import httpx  # already imported by make_http_client
+        errors += (httpx.HTTPError,)
     try:
-        with urlopen(req, timeout=30) as resp:
-            with open(dest, 'wb') as f:
-                f.write(resp.read())
-        return True
-    except (URLError, HTTPError) as e:
-        print(f"  ✗ Failed to download {url}: {e}")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if client is not None:
+            with client.stream('GET', url, headers=headers) as resp:
+                if resp.status_code == 304:
+                    return _response_validators(resp.headers, validators, not_modified=True)
+                resp.raise_for_status()
+                rewritten = _write_body(dest, resp.iter_bytes(DOWNLOAD_CHUNK_SIZE), rewrite)
+        else:
+            try:
+                with _pooled_get(url, headers) as resp:
+                    chunks = iter(lambda: resp.read(DOWNLOAD_CHUNK_SIZE), b'')
+                    rewritten = _write_body(dest, chunks, rewrite)
+            except HTTPError as e:
+                if e.code != 304:
+                    raise
+                return _response_validators(e.headers, validators, not_modified=True)
+        return _response_validators(resp.headers, rewritten=rewritten)
+    except errors as e:
+        raise DownloadError(f"Failed to download {url}: {e}") from e
+
+
+def _gzip_is_fresh(path):
+    """
+    True if `path` has a .gz sibling made from its current contents.
+
+    write_gzip_sibling stamps the .gz with the source's mtime, so any
+    replacement of `path` (even by an older file) breaks the match; the
+    gzip ISIZE trailer (uncompressed size mod 2**32) must match too.
+    """
+    gz_path = path + GZIP_SUFFIX
+    try:
+        st = os.stat(path)
+        if os.stat(gz_path).st_mtime_ns != st.st_mtime_ns:
+            return False
+        with open(gz_path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            isize = int.from_bytes(f.read(4), 'little')
+    except OSError:
         return False
+    return isize == st.st_size & 0xFFFFFFFF
+
+
+def write_gzip_sibling(path):
+    """
+    Write `path`.gz (level 9) next to `path` unless an up-to-date one exists.
+
+    Written to a temporary file and renamed into place, so the server
+    never picks up a partial archive, then given `path`'s mtime for
+    _gzip_is_fresh. Raises OSError if it can't be written.
+    """
+    path = str(path)
+    st = os.stat(path)
+    if st.st_size < GZIP_MIN_SIZE or _gzip_is_fresh(path):
+        return
+    with open(path, 'rb') as f:
+        data = gzip.compress(f.read(), compresslevel=9, mtime=0)
+    gz_path = path + GZIP_SUFFIX
+    _write_atomic(gz_path, [data])
+    os.utime(gz_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _try_gzip_sibling(path):
+    """write_gzip_sibling, returning the OSError instead of raising it."""
+    try:
+        write_gzip_sibling(path)
+    except OSError as e:
+        return e
+    return None
+
+
+def gzip_bundles(web_dir):
+    """
+    Give every .js under libs/ and npm/ an up-to-date .gz sibling.
+
+    Covers what vendor_libs doesn't download, notably the multi-MB
+    pre-bundled @polkadot_* packages shipped in libs/. Fresh siblings cost
+    only a stat and a 4-byte read, so this is cheap to run before every
+    serve. A file whose .gz can't be written (e.g. a read-only tree) is
+    just served uncompressed.
+    """
+    paths = []
+    for name in GZIP_DIRS:
+        for root, _, files in os.walk(os.path.join(web_dir, name)):
+            paths.extend(os.path.join(root, f) for f in files if f.endswith('.js'))
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        errors = [e for e in pool.map(_try_gzip_sibling, paths) if e is not None]
+    if errors:
+        print(f"⚠ Could not write {len(errors)} .gz file(s); serving those uncompressed.")
+        print(f"  First error: {errors[0]}")
+
+
+def _download_and_gzip(url, copies, client, validators):
+    """
+    Download `url` once into every (dest, rewrite) in `copies`.
+
+    The first copy is fetched with download_file. The others are written
+    from its bytes, applying their own `rewrite`, which is why vendor_libs
+    puts a copy that is not rewritten first whenever there is one. Each
+    copy then gets its .gz sibling refreshed.
+
+    Returns (download_file's result, whether each copy's imports ended up
+    rewritten); raises DownloadError on failure.
+    """
+    primary_dest, primary_rewrite = copies[0]
+    result = download_file(url, primary_dest, client, validators, primary_rewrite)
+    rewritten = [result['rewritten']]
+    try:
+        if len(copies) > 1 and not result['not_modified']:
+            with open(primary_dest, 'rb') as f:
+                body = f.read()
+            for dest, rewrite in copies[1:]:
+                Path(dest).parent.mkdir(parents=True, exist_ok=True)
+                if primary_rewrite:
+                    # Every copy wants the rewrite, and body already has it
+                    _write_body(dest, [body], False)
+                    rewritten.append(result['rewritten'])
+                else:
+                    rewritten.append(_write_body(dest, [body], rewrite))
+        else:
+            rewritten *= len(copies)
+    except OSError as e:
+        raise DownloadError(f"Failed to write {url} to disk: {e}") from e
+    # A .gz that can't be written isn't a failed download; gzip_bundles
+    # retries and reports it once vendoring is done
+    for dest, _ in copies:
+        _try_gzip_sibling(dest)
+    return result, rewritten
+
+
+def _load_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    """Write `data` as JSON atomically (temp file + rename)."""
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_vendor_cache(path):
+    """Load the vendor cache (relative path -> url/etag/last_modified); {} if absent."""
+    return _load_json(path)
+
+
+def save_vendor_cache(path, cache):
+    """Write the vendor cache atomically (temp file + rename)."""
+    _save_json(path, cache)
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file (hashlib.file_digest on Python 3.11+)."""
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+def update_manifest(libs_dir, web_dir, paths):
+    """
+    Record the SHA-256 of `paths` (keyed relative to web_dir) in libs/.manifest.sha256.
+
+    Only pass files that were just downloaded in full: the manifest is
+    what verify_libs trusts, so entries for everything else are kept as
+    they were rather than re-hashed from whatever is on disk.
+    """
+    manifest_path = libs_dir / MANIFEST_NAME
+    manifest = _load_json(manifest_path)
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        digests = list(pool.map(file_sha256, paths))
+    for p, digest in zip(paths, digests):
+        manifest[Path(os.path.relpath(p, web_dir)).as_posix()] = digest
+    _save_json(manifest_path, manifest)
+
+
+def verify_libs(libs_dir, web_dir):
+    """
+    Check vendored files against libs/.manifest.sha256 and re-fetch bad ones.
+
+    check_libs_exist only looks for the files; this catches the truncated
+    or empty bundles an interrupted download can leave behind. Every
+    vendor_libs target is checked: missing files and mismatches are
+    downloaded again in parallel, replacing the bad copy only once the
+    new one is complete. Files with no manifest entry (e.g. the bundles
+    shipped with a fresh checkout) can't be checked, so they are only
+    listed, with a pointer to --refresh, which records their checksums.
+    Returns True if nothing needed repairing or every repair succeeded.
+    """
+    manifest = _load_json(libs_dir / MANIFEST_NAME)
+    rel_paths = [
+        Path(os.path.relpath(dest, web_dir)).as_posix()
+        for copies in vendor_targets(libs_dir, web_dir).values()
+        for dest, _, _ in copies
+    ]
+
+    def check(rel_path):
+        path = os.path.join(web_dir, rel_path)
+        expected = manifest.get(rel_path)
+        if expected is None:
+            # Nothing to compare against, but a missing file is still missing
+            return "unverified" if os.path.exists(path) else "missing"
+        try:
+            if file_sha256(path) == expected:
+                return None
+            return "corrupted"
+        except FileNotFoundError:
+            return "missing"
+        except OSError:
+            return "unreadable"
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        problems = dict(zip(rel_paths, pool.map(check, rel_paths)))
+    unverified = sorted(p for p, problem in problems.items() if problem == "unverified")
+    bad = sorted(p for p, problem in problems.items() if problem and problem != "unverified")
+    if unverified:
+        if len(unverified) == len(rel_paths):
+            print(f"No {MANIFEST_NAME} entries yet, so nothing could be verified.")
+        else:
+            print(f"{len(unverified)} vendored file(s) have no {MANIFEST_NAME} entry:")
+            for rel_path in unverified:
+                print(f"  ? {rel_path}")
+        print("  Run with --refresh (needs internet access) to record their checksums.")
+    if not bad:
+        verified = len(rel_paths) - len(unverified)
+        if not unverified:
+            print(f"All {verified} vendored files match {MANIFEST_NAME}.")
+        elif verified:
+            print(f"The other {verified} vendored files match {MANIFEST_NAME}.")
+        return True
+
+    print(f"{len(bad)} vendored file(s) failed verification:")
+    for rel_path in bad:
+        print(f"  ✗ {rel_path} ({problems[rel_path]})")
+    print()
+    sys.stdout.flush()
+    return vendor_libs(libs_dir, web_dir, force=bad)
+
+
+# Files check_libs_exist expects, relative to libs/ and to the web root
+_LIBS_RELS = (
+    # Polkadot bundles (directory-based packages)
+    "@polkadot_util@13.4.4/bundle-polkadot-util.js",
+    "@polkadot_util-crypto@13.4.4/bundle-polkadot-util-crypto.js",
+    "@polkadot_util-crypto@13.4.4/index.js",
+    "@polkadot_util@13.4.4/index.js",
+    "@polkadot_wasm-crypto@7.4.1/index.js",
+    "@polkadot_wasm-bridge@7.4.1/index.js",
+    "@polkadot_wasm-util@7.4.1/index.js",
+    # Single-file ESM bundles (from jsDelivr CDN)
+    "@noble_hashes_utils@1.7.1.js",
+    "@noble_hashes_sha3.js",
+    "@noble_hashes_blake2b.js",
+    "@noble_hashes_scrypt.js",
+    "@noble_curves_secp256k1.js",
+    "@scure_base@1.2.4.js",
+    "@scure_bip32@1.6.2.js",
+    "@scure_bip39@1.5.4.js",
+    "@scure_bip39_wordlist_english.js",
+    "tweetnacl@1.0.3.js",
+)
+_WEB_RELS = (
+    # Sub-module ESM bundles referenced by the CDN bundles via absolute /npm/ paths
+    "npm/@noble/hashes@1.7.1/crypto/+esm.js",
+    "npm/@noble/hashes@1.7.1/sha256/+esm.js",
+    "npm/@noble/hashes@1.7.1/sha512/+esm.js",
+    "npm/@noble/hashes@1.7.1/hmac/+esm.js",
+    "npm/@noble/hashes@1.7.1/utils/+esm.js",
+    "npm/@noble/hashes@1.7.1/_assert/+esm.js",
+    "npm/@noble/hashes@1.7.1/ripemd160/+esm.js",
+    "npm/@noble/curves@1.8.1/secp256k1/+esm.js",
+    "npm/@noble/curves@1.8.1/abstract/modular/+esm.js",
+    "npm/@scure/base@1.2.2/+esm.js",
+    # @polkadot ESM bundles referenced by the importmap
+    "npm/@polkadot/networks@13.4.4/+esm.js",
+    "npm/@polkadot/x-bigint@13.4.4/+esm.js",
+)
+
+
+def _names_by_dir(rel_paths):
+    """Group relative file paths as {relative directory: set of file names}."""
+    grouped = {}
+    for rel_path in rel_paths:
+        directory, name = os.path.split(rel_path)
+        grouped.setdefault(directory, set()).add(name)
+    return grouped
+
+
+_LIBS_NAMES_BY_DIR = _names_by_dir(_LIBS_RELS)
+_WEB_NAMES_BY_DIR = _names_by_dir(_WEB_RELS)
 
 
 def check_libs_exist(libs_dir, web_dir):
     """Check if all required vendored libs exist."""
-    expected_files = [
-        # Polkadot bundles (directory-based packages)
-        libs_dir / "@polkadot_util@13.4.4" / "bundle-polkadot-util.js",
-        libs_dir / "@polkadot_util-crypto@13.4.4" / "bundle-polkadot-util-crypto.js",
-        libs_dir / "@polkadot_util-crypto@13.4.4" / "index.js",
-        libs_dir / "@polkadot_util@13.4.4" / "index.js",
-        libs_dir / "@polkadot_wasm-crypto@7.4.1" / "index.js",
-        libs_dir / "@polkadot_wasm-bridge@7.4.1" / "index.js",
-        libs_dir / "@polkadot_wasm-util@7.4.1" / "index.js",
-        # Single-file ESM bundles (from jsDelivr CDN)
-        libs_dir / "@noble_hashes_utils@1.7.1.js",
-        libs_dir / "@noble_hashes_sha3.js",
-        libs_dir / "@noble_hashes_blake2b.js",
-        libs_dir / "@noble_hashes_scrypt.js",
-        libs_dir / "@noble_curves_secp256k1.js",
-        libs_dir / "@scure_base@1.2.4.js",
-        libs_dir / "@scure_bip32@1.6.2.js",
-        libs_dir / "@scure_bip39@1.5.4.js",
-        libs_dir / "@scure_bip39_wordlist_english.js",
-        libs_dir / "tweetnacl@1.0.3.js",
-        # Sub-module ESM bundles referenced by the CDN bundles via absolute /npm/ paths
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "crypto" / "+esm.js",
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "sha256" / "+esm.js",
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "sha512" / "+esm.js",
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "hmac" / "+esm.js",
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "utils" / "+esm.js",
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "_assert" / "+esm.js",
-        web_dir / "npm" / "@noble" / "hashes@1.7.1" / "ripemd160" / "+esm.js",
-        web_dir / "npm" / "@noble" / "curves@1.8.1" / "secp256k1" / "+esm.js",
-        web_dir / "npm" / "@noble" / "curves@1.8.1" / "abstract" / "modular" / "+esm.js",
-        web_dir / "npm" / "@scure" / "base@1.2.2" / "+esm.js",
-        # @polkadot ESM bundles referenced by the importmap
-        web_dir / "npm" / "@polkadot" / "networks@13.4.4" / "+esm.js",
-        web_dir / "npm" / "@polkadot" / "x-bigint@13.4.4" / "+esm.js",
-    ]
-    return all(f.exists() for f in expected_files)
+    # The files cluster into a few directories: list each directory once
+    # rather than stat()ing every file. A missing directory fails fast.
+    for base, names_by_dir in ((os.fspath(libs_dir), _LIBS_NAMES_BY_DIR),
+                               (os.fspath(web_dir), _WEB_NAMES_BY_DIR)):
+        for directory, names in names_by_dir.items():
+            try:
+                with os.scandir(os.path.join(base, directory)) as entries:
+                    present = {entry.name for entry in entries}
+            except (FileNotFoundError, NotADirectoryError):
+                return False
+            if not names <= present:
+                return False
+    return True
 
 
-def vendor_libs(libs_dir, web_dir):
+def vendor_targets(libs_dir, web_dir):
     """
-    Download ESM bundles from jsDelivr CDN for offline browser use.
+    Map each CDN URL vendor_libs downloads to its destinations.
 
-    The jsDelivr CDN provides pre-built ESM bundles that work directly in browsers.
-    These bundles use relative import paths like './npm/@noble/hashes@1.7.1/crypto/+esm.js'
-    for their internal dependencies. Since the bundles live in libs/, we rewrite those
-    to '../npm/' so they resolve to the web root's /npm/ directory.
+    Returns {url: [(dest path, label, rewrite), ...]}; see vendor_libs for
+    why only the libs/ copies are rewritten.
     """
     CDN = "https://cdn.jsdelivr.net"
 
@@ -111,7 +612,7 @@ def vendor_libs(libs_dir, web_dir):
     # ─── 2. Sub-module ESM bundles referenced by internal imports ───────
     # The jsDelivr ESM bundles use relative imports like:
     #   import "./npm/@noble/hashes@1.7.1/crypto/+esm.js"
-    # After downloading, we rewrite './npm/' to '../npm/' so they resolve
+    # As the libs/ bundles are written, './npm/' is rewritten to '../npm/' so they resolve
     # from libs/ to the web root's npm/ directory.
     npm_submodules = {
         # @noble/hashes sub-modules
@@ -132,101 +633,370 @@ def vendor_libs(libs_dir, web_dir):
         f"{CDN}/npm/@polkadot/x-bigint@13.4.4/+esm":               "npm/@polkadot/x-bigint@13.4.4/+esm.js",
     }
 
-    print(f"Downloading ESM bundles from jsDelivr CDN...")
+    # Single-file bundles go into libs/, sub-modules into the web root's npm/.
+    # Only the libs/ bundles need their './npm/' imports rewritten (see above).
+    # Several URLs appear in both maps: group the destinations per URL so
+    # each is downloaded once, with the npm/ (not rewritten) copy first.
+    targets = {}
+    for url, rel_path in npm_submodules.items():
+        targets.setdefault(url, []).append((web_dir / rel_path, rel_path, False))
+    for url, dest in esm_bundles.items():
+        targets.setdefault(url, []).append((dest, dest.name, True))
+
+    return targets
+
+
+def vendor_libs(libs_dir, web_dir, refresh=False, force=()):
+    """
+    Download ESM bundles from jsDelivr CDN for offline browser use.
+
+    The jsDelivr CDN provides pre-built ESM bundles that work directly in browsers.
+    These bundles use relative import paths like './npm/@noble/hashes@1.7.1/crypto/+esm.js'
+    for their internal dependencies. Since the bundles live in libs/, we rewrite those
+    to '../npm/' so they resolve to the web root's /npm/ directory.
+
+    Files that already exist are skipped unless `refresh` is set, in which
+    case they are revalidated with conditional requests using the ETag /
+    Last-Modified recorded in libs/.vendor-cache.json — unchanged files come
+    back as a bodyless 304 and are not rewritten. Files in `force`
+    (paths relative to web_dir) are always downloaded again in full.
+
+    Every bundle under libs/ and npm/ also gets a gzipped sibling
+    (`<name>.js.gz`, see gzip_bundles) that the offline server sends to
+    browsers accepting gzip, and the SHA-256 of each file downloaded in
+    full goes into libs/.manifest.sha256 for verify_libs (failed, skipped
+    and not-modified files keep their existing entries). Returns True if
+    every download succeeded.
+    """
+    # Progress lines are collected and written PROGRESS_BATCH at a time
+    # rather than one write() per file.
+    out = []
+
+    def report(line=""):
+        out.append(line)
+        if len(out) >= PROGRESS_BATCH:
+            flush_out()
+
+    def flush_out():
+        if out:
+            sys.stdout.write("\n".join(out) + "\n")
+            sys.stdout.flush()
+            out.clear()
+
+    print("Downloading ESM bundles from jsDelivr CDN...")
     print()
 
-    # Download single-file ESM bundles
+    targets = vendor_targets(libs_dir, web_dir)
+
+    cache_path = libs_dir / VENDOR_CACHE_NAME
+    cache = load_vendor_cache(cache_path)
+
     ok_count = 0
     fail_count = 0
-    for url, dest in esm_bundles.items():
-        if dest.exists():
-            print(f"  ✓ {dest.name} (already exists)")
-            ok_count += 1
+    rewrite_count = 0
+    jobs = []
+    downloaded = []  # complete new bodies written this run, for the manifest
+    force = set(force)
+    manifest = _load_json(libs_dir / MANIFEST_NAME)
+    for url, copies in targets.items():
+        keys = [Path(os.path.relpath(dest, web_dir)).as_posix() for dest, _, _ in copies]
+        forced = not force.isdisjoint(keys)
+        all_exist = all(dest.exists() for dest, _, _ in copies)
+        if all_exist and not refresh and not forced:
+            for dest, label, _ in copies:
+                report(f"  ✓ {label} (already exists)")
+                ok_count += 1
             continue
-        print(f"  ↓ {dest.name}")
-        if download_file(url, dest):
-            ok_count += 1
-        else:
-            fail_count += 1
+        entry = cache.get(keys[0])
+        # A 304 leaves every copy untouched, so only ask for one if all
+        # exist, none is known to be bad and all have a manifest entry
+        # (otherwise a full body is fetched so they get one)
+        usable = (all_exist and not forced and entry and entry.get('url') == url
+                  and all(key in manifest for key in keys))
+        jobs.append((url, copies, keys, entry if usable else None))
 
-    print()
-
-    # Download sub-module ESM bundles to web root /npm/ directory
-    print("Downloading sub-module ESM bundles (for internal imports)...")
-    for url, rel_path in npm_submodules.items():
-        dest = web_dir / rel_path
-        if dest.exists():
-            print(f"  ✓ {rel_path} (already exists)")
-            ok_count += 1
-            continue
-        print(f"  ↓ {rel_path}")
-        if download_file(url, dest):
-            ok_count += 1
-        else:
-            fail_count += 1
+    # Downloads are dominated by per-request network latency, so run them
+    # concurrently; results are reported as they complete.
+    client = make_http_client() if jobs else None
+    try:
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            futures = {
+                pool.submit(_download_and_gzip, url,
+                            [(dest, rewrite) for dest, _, rewrite in copies],
+                            client, validators): (url, copies, keys)
+                for url, copies, keys, validators in jobs
+            }
+            for future in as_completed(futures):
+                url, copies, keys = futures[future]
+                # Failures are reported here, on the main thread, so lines
+                # from different workers can't interleave
+                try:
+                    result, rewritten = future.result()
+                except DownloadError as e:
+                    report(f"  ✗ {e}")
+                    fail_count += len(copies)
+                    continue
+                if not result['not_modified']:
+                    downloaded.extend(dest for dest, _, _ in copies)
+                for (dest, label, _), key, was_rewritten in zip(copies, keys, rewritten):
+                    cache[key] = {'url': url, 'etag': result['etag'], 'last_modified': result['last_modified']}
+                    if was_rewritten:
+                        rewrite_count += 1
+                    if result['not_modified']:
+                        report(f"  ✓ {label} (not modified)")
+                    else:
+                        report(f"  ↓ {label}")
+                    ok_count += 1
+    finally:
+        if client is not None:
+            client.close()
+    # Bundles from an earlier run (and the pre-bundled polkadot packages)
+    # may predate their .gz siblings
+    gzip_bundles(web_dir)
+    if jobs:
+        save_vendor_cache(cache_path, cache)
+    if downloaded:
+        update_manifest(libs_dir, web_dir, downloaded)
 
-    # ─── 3. Post-process: rewrite relative imports in libs/ bundles ─────
-    # jsDelivr bundles use './npm/' relative paths for sub-module imports.
-    # Since the bundles live in libs/, './npm/' resolves to libs/npm/ which
-    # doesn't exist. Rewrite to '../npm/' so they resolve to <web_root>/npm/.
-    print("Rewriting relative import paths in vendored bundles...")
-    rewrite_count = 0
-    for dest in esm_bundles.values():
-        if dest.exists():
-            content = dest.read_text(encoding='utf-8')
-            if '"./npm/' in content:
-                content = content.replace('"./npm/', '"../npm/')
-                dest.write_text(content, encoding='utf-8')
-                rewrite_count += 1
-                print(f"  ✓ Rewrote imports in {dest.name}")
     if rewrite_count:
-        print(f"  Rewrote {rewrite_count} file(s).")
-    else:
-        print("  No files needed rewriting.")
+        report(f"  Rewrote relative import paths in {rewrite_count} bundle(s).")
 
-    print()
+    report()
     if fail_count:
-        print(f"⚠ Vendoring finished with {fail_count} failures ({ok_count} succeeded).")
-        print("  Re-run with internet access to retry failed downloads.")
+        report(f"⚠ Vendoring finished with {fail_count} failures ({ok_count} succeeded).")
+        report("  Re-run with internet access to retry failed downloads.")
     else:
-        print(f"✅ All {ok_count} ESM bundles downloaded successfully.")
+        report(f"✅ All {ok_count} ESM bundles downloaded successfully.")
+
+    report()
+    report("Note: Polkadot UMD bundles (@polkadot/util, @polkadot/util-crypto,")
+    report("@polkadot/wasm-crypto, etc.) must be pre-bundled in libs/. These are")
+    report("large WASM-based packages that cannot be vendored via simple downloads.")
+    report("They are included in the release distribution by default.")
+    flush_out()
+    return not fail_count
+
+
+def _accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header value allows gzip."""
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() != 'gzip':
+            continue
+        params = params.replace(' ', '')
+        if not params.startswith('q='):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+class CachingHandler(SimpleHTTPRequestHandler):
+    """
+    SimpleHTTPRequestHandler with strong ETags, Cache-Control and gzip.
+
+    Every file is sent with Cache-Control: no-cache, so the browser keeps
+    a copy but revalidates it on each load, and gets a bodyless 304 while
+    its If-None-Match still matches. Nothing is marked immutable: some
+    vendored names carry no version, and any bundle can be rewritten in
+    place by --refresh or --verify. Files with an up-to-date .gz
+    sibling (written by vendor_libs) are sent pre-compressed to browsers
+    that accept gzip.
+    """
+
+    # path -> (mtime_ns, size, etag); shared by all handler threads
+    etags = {}
+
+    def _etag(self, path):
+        st = os.stat(path)
+        cached = self.etags.get(path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                h.update(chunk)
+        etag = f'"{h.hexdigest()}"'
+        self.etags[path] = (st.st_mtime_ns, st.st_size, etag)
+        return etag
+
+    def send_head(self):
+        self._cache_headers = None
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        gz_path = path + GZIP_SUFFIX
+        use_gzip = (_accepts_gzip(self.headers.get('Accept-Encoding', ''))
+                    and _gzip_is_fresh(path))
+        try:
+            # The two encodings are different representations: distinct ETags
+            etag = self._etag(gz_path if use_gzip else path)
+        except OSError:
+            return super().send_head()
+        cache_headers = [('ETag', etag), ('Cache-Control', SERVE_CACHE_CONTROL)]
+        if use_gzip or os.path.exists(gz_path):
+            cache_headers.append(('Vary', 'Accept-Encoding'))
+        self._cache_headers = cache_headers
+
+        if_none_match = self.headers.get('If-None-Match', '')
+        if etag in (tag.strip() for tag in if_none_match.split(',')):
+            self.send_response(304)
+            self.end_headers()
+            return None
+        if not use_gzip:
+            return super().send_head()
+
+        try:
+            f = open(gz_path, 'rb')
+        except OSError:
+            return super().send_head()
+        try:
+            fs = os.fstat(f.fileno())
+            self.send_response(200)
+            self.send_header('Content-type', self.guess_type(path))
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(fs.st_size))
+            self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
+
+    def end_headers(self):
+        for header in getattr(self, '_cache_headers', None) or ():
+            self.send_header(*header)
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        """
+        Send the file body with os.sendfile (kernel page cache → socket).
+
+        The multi-MB polkadot bundles then never pass through a Python
+        read/write loop. Falls back to the stdlib copy where sendfile is
+        unavailable or refuses the descriptors before anything was sent.
+        """
+        try:
+            in_fd = source.fileno()
+            out_fd = outputfile.fileno()
+            sendfile = os.sendfile
+        except (AttributeError, OSError):
+            return super().copyfile(source, outputfile)
+
+        start = offset = source.tell()
+        remaining = os.fstat(in_fd).st_size - offset
+        try:
+            while remaining > 0:
+                try:
+                    sent = sendfile(out_fd, in_fd, offset, remaining)
+                except (BrokenPipeError, ConnectionResetError):
+                    raise
+                except OSError:
+                    if offset != start:
+                        raise
+                    source.seek(start)
+                    return super().copyfile(source, outputfile)
+                if sent == 0:  # file shrank underneath us
+                    break
+                offset += sent
+                remaining -= sent
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the browser went away mid-transfer
 
-    print()
-    print("Note: Polkadot UMD bundles (@polkadot/util, @polkadot/util-crypto,")
-    print("@polkadot/wasm-crypto, etc.) must be pre-bundled in libs/. These are")
-    print("large WASM-based packages that cannot be vendored via simple downloads.")
-    print("They are included in the release distribution by default.")
-
-def find_python_command():
-    """Find a suitable Python 3 command."""
-    for cmd in ['python3', 'python']:
-        if shutil.which(cmd):
-            try:
-                result = subprocess.run([cmd, '--version'], capture_output=True, text=True, timeout=5)
-                if result.returncode == 0 and 'Python 3' in result.stdout:
-                    return cmd
-            except:
-                continue
-    return None
 
 def start_server(web_dir):
-    """Start the local HTTP server."""
-    python_cmd = find_python_command()
-    if not python_cmd:
-        print("Error: Could not find Python 3 command.")
+    """Serve `web_dir` on 127.0.0.1:8000 until interrupted.
+
+    Runs in-process on a ThreadingHTTPServer, so the 30+ ES modules that
+    index.html pulls in are served over parallel connections instead of
+    one request at a time, with CachingHandler's ETag / Cache-Control.
+    """
+    # A no-op stat pass unless bundles changed since the last run
+    gzip_bundles(web_dir)
+    handler = partial(CachingHandler, directory=str(web_dir))
+    try:
+        server = ThreadingHTTPServer(('127.0.0.1', 8000), handler)
+    except OSError as e:
+        print(f"Error: Could not start server on port 8000: {e}")
         return
 
     print("Starting simple HTTP server on port 8000 (CTRL-C to stop)")
     print()
     print("  → Open in browser: http://localhost:8000/index.html")
     print()
-    os.chdir(web_dir)
+    sys.stdout.flush()
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
+
+def open_in_browser(url):
+    """
+    Open `url` in the user's browser.
+
+    A plain command in $BROWSER is launched directly, skipping the
+    webbrowser module's import and its scan for installed browsers.
+    Anything else (unset, '%s' templates, a failed launch) goes through
+    webbrowser as before.
+    """
+    browser = os.environ.get('BROWSER', '').split(os.pathsep)[0].strip()
+    if browser and '%s' not in browser:
+        try:
+            subprocess.Popen([browser, url])
+            return
+        except OSError:
+            pass
+    import webbrowser
+    webbrowser.open(url)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Prepare the browser interface and serve it locally.",
+        epilog="Without any options every step is asked interactively. With any "
+               "option, nothing is asked: steps not requested are skipped.",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--online', action='store_true',
+                      help="open index.html directly (libraries load from CDN)")
+    mode.add_argument('--offline', action='store_true',
+                      help="use vendored libraries and a local server")
+    parser.add_argument('--vendor', action='store_true',
+                        help="download missing ESM bundles (implies --offline)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="revalidate already vendored bundles against the CDN (implies --vendor)")
+    parser.add_argument('--verify', action='store_true',
+                        help="check vendored bundles against libs/.manifest.sha256 and "
+                             "re-download missing or corrupted ones (implies --offline)")
+    parser.add_argument('--serve', action='store_true',
+                        help="start the local HTTP server (implies --offline)")
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help="answer yes to every step (vendor and serve)")
+    args = parser.parse_args(argv)
+    args.vendor = args.vendor or args.refresh or args.yes
+    args.serve = args.serve or args.yes
+    if args.online and (args.vendor or args.serve or args.verify):
+        parser.error("--online cannot be combined with --vendor, --refresh, --verify, --serve or --yes")
+    args.offline = args.offline or args.vendor or args.serve or args.verify
+    args.interactive = not (args.online or args.offline)
+    return args
+
+def ask(prompt):
+    """input() that returns None when the user aborts (CTRL-C / EOF)."""
     try:
-        subprocess.run([python_cmd, '-m', 'http.server', '8000', '--bind', '127.0.0.1'])
-    except KeyboardInterrupt:
-        print("\nServer stopped.")
+        return input(prompt).strip().lower()
+    except (KeyboardInterrupt, EOFError):
+        print("\nAborted.")
+        return None
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    # stdout is flushed at phase boundaries (input() prompts, vendor_libs,
+    # server start) instead of on every newline.
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(line_buffering=False)
     script_dir = Path(__file__).parent
     root_dir = script_dir.parent
     web_dir = root_dir / "web"
@@ -235,11 +1005,14 @@ def main():
     print("Enjin Snap Wallet Exporter - Browser Setup")
     print("=" * 50)
 
-    try:
-        mode = input("Online or offline use? (online/offline): ").strip().lower()
-    except (KeyboardInterrupt, EOFError):
-        print("\nAborted.")
-        return
+    if args.online:
+        mode = "online"
+    elif args.offline:
+        mode = "offline"
+    else:
+        mode = ask("Online or offline use? (online/offline): ")
+        if mode is None:
+            return
 
     if mode == "online":
         index_path = web_dir / "index.html"
@@ -247,8 +1020,8 @@ def main():
             print("Error: index.html not found.")
             return
         print("Opening index.html in default browser (online mode - loads from CDN)...")
-        import webbrowser
-        webbrowser.open(f"file://{index_path.absolute()}")
+        sys.stdout.flush()
+        open_in_browser(f"file://{index_path.absolute()}")
         print("Done.")
         return
 
@@ -262,38 +1035,53 @@ def main():
         print("Error: index.html not found in web directory.")
         sys.exit(1)
 
+    # Content check first, so anything it re-downloads counts as present below
+    if args.verify:
+        verify_libs(libs_dir, web_dir)
+        print()
+
     # Check if libs are vendored
     if not check_libs_exist(libs_dir, web_dir):
         print("Vendored libraries not found or incomplete.")
-        try:
-            response = input("Download ESM bundles for offline use? (y/N): ").strip().lower()
-        except (KeyboardInterrupt, EOFError):
-            print("\nAborted.")
-            return
-        if response in ('y', 'yes'):
+        if args.interactive:
+            response = ask("Download ESM bundles for offline use? (y/N): ")
+            if response is None:
+                return
+            vendor = response in ('y', 'yes')
+        else:
+            vendor = args.vendor
+        if vendor:
             libs_dir.mkdir(parents=True, exist_ok=True)
-            vendor_libs(libs_dir, web_dir)
+            sys.stdout.flush()
+            vendor_libs(libs_dir, web_dir, refresh=args.refresh)
         else:
             print("Skipping vendoring. Note: browser may not work offline.")
     else:
         print("Vendored libraries found.")
+        if args.refresh:
+            print()
+            sys.stdout.flush()
+            vendor_libs(libs_dir, web_dir, refresh=True)
 
     print()
-    print("Next steps: start a local HTTP server for offline use.")
-
-    try:
-        response = input("Start local HTTP server now? (y/N): ").strip().lower()
-    except (KeyboardInterrupt, EOFError):
-        print("\nAborted.")
-        return
+    if args.interactive:
+        print("Next steps: start a local HTTP server for offline use.")
+        response = ask("Start local HTTP server now? (y/N): ")
+        if response is None:
+            return
+        serve = response in ('y', 'yes')
+    else:
+        serve = args.serve
 
-    if response in ('y', 'yes'):
+    if serve:
         start_server(web_dir)
     else:
+        # Point back at this script rather than 'python -m http.server' so the
+        # in-process server keeps CachingHandler's ETag / Cache-Control.
         print("Skipped starting server. To start later:")
-        print(f"  cd {web_dir} && python3 -m http.server 8000")
+        print(f"  {sys.executable or 'python3'} {Path(__file__).resolve()} --serve")
 
     print("Done.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
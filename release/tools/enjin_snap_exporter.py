@@ -23,8 +23,18 @@ import time
 import hashlib
 import warnings
 import getpass
+import hmac
 import base64
-from dotenv import load_dotenv
+from types import SimpleNamespace
+import importlib.util
+
+try:
+    import orjson  # optional — faster JSON serialization when installed
+except ImportError:
+    orjson = None
+
+# Directory containing this script (used as cwd for the dependency installer)
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def ask_yes_no(prompt, default='y', max_retries=3):
@@ -68,6 +78,11 @@ def ask_choice(prompt, choices, default=None, max_retries=3):
 
 
 def get_password_confirm(prompt1="Enter password for keystore", prompt2="Confirm password", max_retries=3):
+    """Prompt for a new password and its confirmation; returns the password.
+
+    A mismatch re-prompts only the confirmation. Leaving the confirmation
+    empty abandons the password and starts over with the first prompt.
+    """
     for _ in range(max_retries):
         try:
             pw = getpass.getpass(f"  {prompt1}: ")
@@ -77,106 +92,171 @@ def get_password_confirm(prompt1="Enter password for keystore", prompt2="Confirm
         if not pw:
             print('  Error: Password cannot be empty.')
             continue
-        try:
-            confirm = getpass.getpass(f"  {prompt2}: ")
-        except (KeyboardInterrupt, EOFError):
-            print('\nAborted by user.')
+        pw_bytes = pw.encode('utf-8')
+        for _ in range(max_retries):
+            try:
+                confirm = getpass.getpass(f"  {prompt2}: ")
+            except (KeyboardInterrupt, EOFError):
+                print('\nAborted by user.')
+                sys.exit(1)
+            if not confirm:
+                break
+            if hmac.compare_digest(pw_bytes, confirm.encode('utf-8')):
+                return pw
+            print('  Error: Passwords do not match (leave empty to choose a new password).')
+        else:
+            print('Too many mismatched confirmations. Aborting.')
             sys.exit(1)
-        if pw != confirm:
-            print('  Error: Passwords do not match.')
-            continue
-        return pw
+        print('  Starting over with a new password.')
     print('Too many invalid password attempts. Aborting.')
     sys.exit(1)
 
-# Check for required dependencies before importing them
-print("Checking for required libraries...")
-required_modules = [
-    'substrateinterface',
-    'eth_account',
-    'bip_utils',
-    'nacl.secret',
-    'Crypto.Protocol.KDF'  # pycryptodome — reliable scrypt KDF
-]
-
-if getattr(sys, 'frozen', False) or hasattr(sys, '_MEIPASS'):
-    # Bundled executable, dependencies should be included
-    print("Running from bundled executable — dependencies included.")
-else:
-    missing_modules = []
-    for module in required_modules:
-        try:
-            __import__(module)
-        except ImportError:
-            missing_modules.append(module)
-
-    if missing_modules:
-        print("Error: Missing required Python modules:")
-        for module in missing_modules:
-            print(f"  - {module}")
-        print()
-
-        install = ask_yes_no("Would you like to install the missing dependencies automatically? (y/n): ", default='n')
-        if install:
-            print("Downloading and installing required libraries...")
-            import subprocess
+SS58_FORMAT = 1110       # Enjin Matrixchain
+SS58_RELAY_FORMAT = 2135  # Enjin Relaychain
+
+# Polkadot keystore scrypt parameters (matching Polkadot.js defaults — do not change)
+SCRYPT_N = 1 << 15  # 32768
+SCRYPT_P = 1
+SCRYPT_R = 8
+# N, p, r as stored in the encoded blob: three little-endian uint32s
+SCRYPT_PARAMS_LE = struct.pack('<III', SCRYPT_N, SCRYPT_P, SCRYPT_R)
+
+# PKCS8 encoding of ed25519 keypair
+# Header: SEQUENCE, INTEGER(version=1), AlgorithmIdentifier(ed25519 OID),
+#         OCTET STRING wrapping the secret key
+PKCS8_HEADER = bytes([
+    0x30, 0x53, 0x02, 0x01, 0x01, 0x30, 0x05, 0x06,
+    0x03, 0x2b, 0x65, 0x70, 0x04, 0x22, 0x04, 0x20
+])
+PKCS8_DIVIDER = bytes([0xa1, 0x23, 0x03, 0x21, 0x00])
+
+
+def _ensure_deps():
+    """
+    Check the required dependencies are installed, offering to install them.
+
+    Called from main() rather than at import time, so the module can be
+    imported as a library without the probe or the install prompt. The
+    dependencies themselves are imported inside the functions that use them.
+    """
+    print("Checking for required libraries...")
+    required_modules = [
+        'dotenv',
+        'substrateinterface',
+        # Imported directly for sr25519 / SS58; installed as dependencies of
+        # substrate-interface, but their native wheels can be missing
+        'bip39',
+        'sr25519',
+        'scalecodec.utils.ss58',
+        'eth_account',
+        'bip_utils',
+        'nacl.bindings',
+    ]
+
+    if getattr(sys, 'frozen', False) or hasattr(sys, '_MEIPASS'):
+        # Bundled executable, dependencies should be included
+        print("Running from bundled executable — dependencies included.")
+    else:
+        # find_spec locates each module without executing it; the actual
+        # (slow) imports happen in the functions that need them.
+        missing_modules = []
+        for module in required_modules:
             try:
-                # Try different pip commands in order of preference
-                pip_commands = [
-                    ['pip', 'install', '-r', 'requirements.txt'],
-                    ['pip3', 'install', '-r', 'requirements.txt'],
-                    ['python3', '-m', 'pip', 'install', '-r', 'requirements.txt'],
-                    ['python', '-m', 'pip', 'install', '-r', 'requirements.txt']
-                ]
-
-                success = False
-                for cmd in pip_commands:
-                    try:
-                        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(__file__))
-                        if result.returncode == 0:
-                            success = True
-                            break
-                        else:
-                            print(f"Command {' '.join(cmd)} failed, trying next option...")
-                    except FileNotFoundError:
-                        continue
-
-                if not success:
-                    print("Failed to install with pip/pip3/python -m pip. Error output:")
-                    print(result.stderr if 'result' in locals() else "No pip command found")
-                    raise Exception("Installation failed")
-
-                print("Dependencies installed successfully!")
-                print("Please run the script again.")
-                sys.exit(0)
-
-            except FileNotFoundError:
-                print("pip not found. Please install pip or run the manual installation commands below.")
-            except Exception as e:
-                print(f"Installation failed: {e}")
-                print("Please try the manual installation commands below.")
-        else:
-            print("Installation cancelled by user.")
-
-        # Show manual installation instructions
-        print("\nManual installation:")
-        print("pip install -r requirements.txt")
-        print("or pip3 install -r requirements.txt")
-        print("or manually: pip install python-dotenv substrate-interface eth-account bip-utils PyNaCl pycryptodome")
-        print("or manually: pip3 install python-dotenv substrate-interface eth-account bip-utils PyNaCl pycryptodome")
+                found = importlib.util.find_spec(module) is not None
+            except ImportError:
+                # Parent package of a dotted name is missing
+                found = False
+            if not found:
+                missing_modules.append(module)
+
+        if missing_modules:
+            print("Error: Missing required Python modules:")
+            for module in missing_modules:
+                print(f"  - {module}")
+            print()
+
+            install = ask_yes_no("Would you like to install the missing dependencies automatically? (y/n): ", default='n')
+            if install:
+                print("Downloading and installing required libraries...")
+                import subprocess
+                try:
+                    # Use the pip of the interpreter running this script, so the
+                    # packages land where the next run will import them from.
+                    cmd = [sys.executable, '-m', 'pip', 'install', '-r', 'requirements.txt']
+                    result = subprocess.run(cmd, capture_output=True, text=True, cwd=_SCRIPT_DIR)
+                    if result.returncode != 0:
+                        print(f"Command {' '.join(cmd)} failed. Error output:")
+                        print(result.stderr)
+                        raise Exception("Installation failed")
+
+                    print("Dependencies installed successfully!")
+                    print("Please run the script again.")
+                    sys.exit(0)
+
+                except FileNotFoundError:
+                    print("pip not found. Please install pip or run the manual installation commands below.")
+                except Exception as e:
+                    print(f"Installation failed: {e}")
+                    print("Please try the manual installation commands below.")
+            else:
+                print("Installation cancelled by user.")
+
+            # Show manual installation instructions
+            print("\nManual installation:")
+            print("pip install -r requirements.txt")
+            print("or pip3 install -r requirements.txt")
+            print("or manually: pip install python-dotenv substrate-interface eth-account bip-utils PyNaCl")
+            print("or manually: pip3 install python-dotenv substrate-interface eth-account bip-utils PyNaCl")
+            sys.exit(1)
+
+    # The keystore KDF relies on OpenSSL's scrypt via hashlib. Fail here, before
+    # any secrets are loaded, rather than halfway through a keystore export.
+    if not hasattr(hashlib, 'scrypt'):
+        print("Error: This Python build does not provide hashlib.scrypt (OpenSSL 1.1+ required).")
+        print("Please use a Python interpreter linked against OpenSSL, e.g. from python.org.")
         sys.exit(1)
 
-# Now safe to import
-from substrateinterface import Keypair, KeypairType
-from eth_account import Account
-from bip_utils import Bip39SeedGenerator, Bip32Slip10Secp256k1
-from nacl.secret import SecretBox
-from Crypto.Protocol.KDF import scrypt as crypto_scrypt
+    print("All required libraries are available. You may now disconnect the device from the internet to generate the private key and keystore export offline.")
 
-SS58_FORMAT = 1110       # Enjin Matrixchain
-SS58_RELAY_FORMAT = 2135  # Enjin Relaychain
 
-print("All required libraries are available. You may now disconnect the device from the internet to generate the private key and keystore export offline.")
+def check_mnemonic(mnemonic):
+    """
+    Validate an English BIP-39 mnemonic before any seed derivation runs.
+
+    Checks the word count, that every word is in the wordlist and the
+    checksum — all cheap lookups, so a typo is reported in microseconds
+    rather than after the PBKDF2 stretches. Returns None if valid, otherwise
+    an error message that refers to words by position only, never by value.
+    The per-word check needs bip_utils' internal wordlist module; if a
+    release moves it, only the combined validator check runs.
+    """
+    from bip_utils import Bip39Languages, Bip39MnemonicValidator
+    try:
+        # Not part of bip_utils' public API; only used to name bad positions
+        from bip_utils.bip.bip39.bip39_mnemonic_utils import Bip39WordsListGetter
+    except ImportError:
+        Bip39WordsListGetter = None
+
+    words = mnemonic.split()
+    if len(words) not in (12, 15, 18, 21, 24):
+        return f"found {len(words)} words; expected 12, 15, 18, 21 or 24."
+
+    if Bip39WordsListGetter is not None:
+        words_list = Bip39WordsListGetter().GetByLanguage(Bip39Languages.ENGLISH)
+        unknown = []
+        for position, word in enumerate(words, start=1):
+            try:
+                words_list.GetWordIdx(word)
+            except ValueError:
+                unknown.append(str(position))
+        if unknown:
+            return f"word(s) at position(s) {', '.join(unknown)} are not in the BIP-39 English wordlist."
+
+    if not Bip39MnemonicValidator(Bip39Languages.ENGLISH).IsValid(" ".join(words)):
+        if Bip39WordsListGetter is None:
+            return "invalid mnemonic — check for a misspelled word, a wrong word or word order."
+        return "checksum mismatch — check for a wrong word or word order."
+    return None
 
 
 def load_mnemonic():
@@ -187,8 +267,10 @@ def load_mnemonic():
     - If `.env` does not exist and no example exists, create a minimal `.env` template.
     - If `.env` exists but `MNEMONIC` is not set or empty, prompt the user to edit the file
       and confirm when ready.
-    - Never print or log the mnemonic value.
+    - Never print or log the mnemonic value, and never export it to the process environment.
     """
+    from dotenv import dotenv_values
+
     env_path = os.path.join(os.getcwd(), '.env')
     example_path = os.path.join(os.getcwd(), '.env.example')
 
@@ -213,8 +295,9 @@ def load_mnemonic():
 
     # Loop until we have a non-empty MNEMONIC or the user aborts
     while True:
-        load_dotenv(dotenv_path=env_path)
-        mnemonic = os.getenv('MNEMONIC')
+        # dotenv_values parses the file without touching os.environ, so the
+        # mnemonic is never inherited by child processes
+        mnemonic = dotenv_values(env_path).get('MNEMONIC')
         if mnemonic and mnemonic.strip() != '':
             # Reminder: always ask user to confirm they want to proceed
             print('\nReminder: Your recovery phrase should be placed in the .env file as:')
@@ -227,7 +310,14 @@ def load_mnemonic():
                 sys.exit(1)
 
             if proceed == 'y':
-                return mnemonic.strip()
+                error = check_mnemonic(mnemonic)
+                if error is None:
+                    return mnemonic.strip()
+                print(f'\nInvalid MNEMONIC in .env: {error}')
+                if ask_yes_no('\nHave you corrected your MNEMONIC in .env and want to continue? (y/n): ', default='n'):
+                    continue
+                print('Aborting. Fix your MNEMONIC in .env and run the script again when ready.')
+                sys.exit(1)
             else:
                 print('Aborting. Edit or remove .env as needed and run the script again when ready.')
                 sys.exit(1)
@@ -244,63 +334,128 @@ def load_mnemonic():
             sys.exit(1)
 
 
-def derive_ethereum(mnemonic):
-    """Derive Ethereum address using standard BIP-44 path m/44'/60'/0'/0/0."""
-    Account.enable_unaudited_hdwallet_features()
-    return Account.from_mnemonic(mnemonic, account_path="m/44'/60'/0'/0/0")
+def derive_ethereum(bip39_seed):
+    """Derive Ethereum account using standard BIP-44 path m/44'/60'/0'/0/0.
 
+    Derived from the shared BIP-39 seed via bip-utils, so eth-account's HD
+    wallet path (and its extra PBKDF2 pass over the mnemonic) is not needed.
+    """
+    from bip_utils import Bip32Slip10Secp256k1
+    from eth_account import Account
 
-def derive_matrixchain_sr25519(mnemonic):
-    """Derive sr25519 Matrixchain keypair with blank derivation path."""
-    return Keypair.create_from_uri(
-        mnemonic,
-        ss58_format=SS58_FORMAT,
-        crypto_type=KeypairType.SR25519
+    bip32_node = Bip32Slip10Secp256k1.FromSeedAndPath(bip39_seed, "m/44'/60'/0'/0/0")
+    return Account.from_key(bip32_node.PrivateKey().Raw().ToBytes())
+
+
+def _json_dump(obj, f):
+    """Write obj to text file f as 2-space-indented JSON, via orjson if available."""
+    if orjson is not None:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8'))
+    else:
+        json.dump(obj, f, indent=2)
+
+
+def derive_bip39_seed(mnemonic):
+    """Generate the 64-byte BIP-39 seed shared by the Ethereum and Enjin Snap derivations."""
+    from bip_utils import Bip39SeedGenerator
+
+    return Bip39SeedGenerator(mnemonic).Generate()
+
+
+def derive_sr25519_mini_secret(mnemonic):
+    """
+    Derive the Substrate mini-secret behind blank-path sr25519 keypairs.
+
+    Substrate does not use the BIP-39 seed here: it runs PBKDF2 over the
+    mnemonic's entropy instead. Computed once and shared by the Matrixchain
+    and Relaychain derivations.
+    """
+    # py-bip39-bindings: substrate-interface's own backend, installed with it
+    from bip39 import bip39_to_mini_secret
+
+    return bytes(bip39_to_mini_secret(mnemonic, ""))
+
+
+def _sr25519_keypair(mini_secret, ss58_format):
+    """sr25519 keypair as SimpleNamespace(public_key, ss58_address)."""
+    # substrate-interface's own backends (installed with it), called directly
+    # to skip the Keypair wrapper
+    from sr25519 import pair_from_seed as sr25519_pair_from_seed
+    from scalecodec.utils.ss58 import ss58_encode
+
+    public_key, _ = sr25519_pair_from_seed(mini_secret)
+    return SimpleNamespace(
+        public_key=public_key,
+        ss58_address=ss58_encode(public_key, ss58_format)
     )
 
 
-def derive_relaychain_sr25519(mnemonic):
+def derive_matrixchain_sr25519(mini_secret):
+    """Derive sr25519 Matrixchain keypair with blank derivation path."""
+    return _sr25519_keypair(mini_secret, SS58_FORMAT)
+
+
+def derive_relaychain_sr25519(mini_secret):
     """Derive sr25519 Relaychain keypair with blank derivation path, SS58 format 2135."""
-    return Keypair.create_from_uri(
-        mnemonic,
-        ss58_format=SS58_RELAY_FORMAT,
-        crypto_type=KeypairType.SR25519
-    )
+    return _sr25519_keypair(mini_secret, SS58_RELAY_FORMAT)
 
 
-def derive_enjin_snap_ed25519(mnemonic):
+def derive_enjin_snap_ed25519(bip39_seed):
     """
     Derive Enjin Snap ed25519 keypair replicating the snap's account.ts logic:
 
       BIP-39 seed → SLIP-10 secp256k1 at m/44'/1155' → 0x-prefixed hex →
       first 32 chars → UTF-8 encode → ed25519 seed
 
-    Returns (keypair, seed_bytes) tuple.
+    Takes the BIP-39 seed (as generated once in main()) rather than the
+    mnemonic, so the PBKDF2 stretch is not repeated here.
+
+    The keypair is built directly with libsodium rather than a substrate
+    Keypair: only the public key and SS58 address are ever used.
+
+    Returns (keypair, seed_bytes) tuple, where keypair has `public_key`
+    (bytes) and `ss58_address` (Matrixchain) attributes.
     """
-    # Step 1: Generate BIP-39 seed from mnemonic
-    bip39_seed = Bip39SeedGenerator(mnemonic).Generate()
+    from bip_utils import Bip32Slip10Secp256k1
+    from nacl.bindings import crypto_sign_seed_keypair
+    from scalecodec.utils.ss58 import ss58_encode
 
-    # Step 2: Derive SLIP-10 secp256k1 key at m/44'/1155'
+    # Step 1: Derive SLIP-10 secp256k1 key at m/44'/1155'
     bip32_node = Bip32Slip10Secp256k1.FromSeedAndPath(bip39_seed, "m/44'/1155'")
 
-    # Step 3: Get 0x-prefixed hex private key (like MetaMask's key-tree)
+    # Step 2: Get 0x-prefixed hex private key (like MetaMask's key-tree)
     priv_key_hex = "0x" + bip32_node.PrivateKey().Raw().ToHex()
 
-    # Step 4: .slice(0, 32) — first 32 characters of the hex string
+    # Step 3: .slice(0, 32) — first 32 characters of the hex string
     seed_str = priv_key_hex[:32]
 
-    # Step 5: stringToU8a — convert to UTF-8 bytes (each ASCII char = 1 byte)
+    # Step 4: stringToU8a — convert to UTF-8 bytes (each ASCII char = 1 byte)
     seed_bytes = seed_str.encode('utf-8')
 
-    # Step 6: Create ed25519 keypair from seed
-    keypair = Keypair.create_from_seed(
-        seed_bytes,
-        ss58_format=SS58_FORMAT,
-        crypto_type=KeypairType.ED25519
+    # Step 5: Create ed25519 keypair from seed (seed_bytes is exactly 32 bytes)
+    public_key, _ = crypto_sign_seed_keypair(seed_bytes)
+    keypair = SimpleNamespace(
+        public_key=public_key,
+        ss58_address=ss58_encode(public_key, SS58_FORMAT)
     )
     return keypair, seed_bytes
 
 
+def derive_scrypt_key(password_bytes, salt):
+    """
+    Derive a 32-byte encryption key with scrypt (SCRYPT_N, SCRYPT_R, SCRYPT_P).
+
+    Uses OpenSSL via hashlib.scrypt (availability is checked at startup).
+    The caller supplies the salt, so a key is never reused across keystores.
+    """
+    # maxmem must exceed 128 * N * r (32 MiB here) — OpenSSL's default cap
+    # is exactly 32 MiB and would reject these parameters.
+    return hashlib.scrypt(
+        password_bytes, salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32,
+        maxmem=128 * SCRYPT_N * SCRYPT_R * 2
+    )
+
+
 def build_keystore(keypair, seed_bytes, password):
     """
     Build a Polkadot-compatible encrypted JSON keystore.
@@ -312,52 +467,21 @@ def build_keystore(keypair, seed_bytes, password):
 
     Returns keystore dict.
     """
-    # PKCS8 encoding of ed25519 keypair
-    # Header: SEQUENCE, INTEGER(version=1), AlgorithmIdentifier(ed25519 OID),
-    #         OCTET STRING wrapping the secret key
-    pkcs8_header = bytes([
-        0x30, 0x53, 0x02, 0x01, 0x01, 0x30, 0x05, 0x06,
-        0x03, 0x2b, 0x65, 0x70, 0x04, 0x22, 0x04, 0x20
-    ])
-    pkcs8_divider = bytes([0xa1, 0x23, 0x03, 0x21, 0x00])
-    plaintext = pkcs8_header + seed_bytes + pkcs8_divider + keypair.public_key
-
-    # Scrypt parameters (matching Polkadot.js defaults — do not change)
-    scrypt_n = 1 << 15  # 32768
-    scrypt_p = 1
-    scrypt_r = 8
+    from nacl.bindings import crypto_secretbox
+
+    # PKCS8 encoding of ed25519 keypair (see PKCS8_HEADER)
+    plaintext = b"".join((PKCS8_HEADER, seed_bytes, PKCS8_DIVIDER, keypair.public_key))
+
     salt = os.urandom(32)
+    key = derive_scrypt_key(password.encode('utf-8'), salt)
 
-    # Derive encryption key via scrypt
-    # Try hashlib.scrypt (stdlib, requires OpenSSL with scrypt support),
-    # then fall back to PyCryptodome's scrypt (always correct).
-    # NOTE: The previous PyNaCl fallback (nacl.pwhash.scrypt.kdf) was BROKEN —
-    # libsodium's opslimit/memlimit API does NOT map to standard scrypt N/r/p
-    # parameters, producing a wrong key and causing "Unable to decode" errors
-    # in Polkadot.js when importing the keystore.
-    password_bytes = password.encode('utf-8')
-    try:
-        key = hashlib.scrypt(
-            password_bytes, salt=salt, n=scrypt_n, r=scrypt_r, p=scrypt_p, dklen=32
-        )
-    except (AttributeError, ValueError):
-        # hashlib.scrypt unavailable (e.g. macOS with LibreSSL) — use PyCryptodome
-        key = crypto_scrypt(password_bytes, salt, 32, scrypt_n, scrypt_r, scrypt_p)
-
-    # Encrypt with xsalsa20-poly1305
+    # Encrypt with xsalsa20-poly1305 (libsodium's raw secretbox returns
+    # MAC + ciphertext only; the nonce is stored separately below)
     nonce = os.urandom(24)
-    box = SecretBox(key)
-    encrypted = box.encrypt(plaintext, nonce)[24:]  # strip prepended nonce
+    encrypted = crypto_secretbox(plaintext, nonce, key)
 
     # Build the encoded blob: salt + N(LE) + p(LE) + r(LE) + nonce + ciphertext
-    encoded_bytes = (
-        salt
-        + struct.pack('<I', scrypt_n)
-        + struct.pack('<I', scrypt_p)
-        + struct.pack('<I', scrypt_r)
-        + nonce
-        + encrypted
-    )
+    encoded_bytes = b"".join((salt, SCRYPT_PARAMS_LE, nonce, encrypted))
     encoded_b64 = base64.b64encode(encoded_bytes).decode('ascii')
 
     return {
@@ -370,7 +494,7 @@ def build_keystore(keypair, seed_bytes, password):
         "address": keypair.ss58_address,
         "meta": {
             "name": "Enjin Snap",
-            "whenCreated": int(time.time() * 1000)
+            "whenCreated": time.time_ns() // 1_000_000
         }
     }
 
@@ -380,15 +504,23 @@ def build_web3_keystore(private_key_hex, password):
     Build a Web3 / Ethereum v3 keystore JSON using eth-account's helper.
 
     Returns a dict conforming to the Web3 Secret Storage Definition (version 3).
+
+    The KDF is pinned to scrypt with N=SCRYPT_N (r=8, p=1) — the same cost
+    as the Polkadot-style keystore — instead of eth-account's default
+    N=262144, which is 8x slower. N is recorded in the keystore's kdfparams,
+    so readers decrypt either way; changing it only changes new exports.
     """
-    # eth_account.Account.encrypt will produce the correct v3 JSON structure
-    # using the default KDF (scrypt/pbkdf2 depending on implementation). It
-    # preserves the expected fields: address, id, version, crypto { cipher,... }.
-    return Account.encrypt(private_key_hex, password)
+    from eth_account import Account
+
+    return Account.encrypt(private_key_hex, password, kdf='scrypt', iterations=SCRYPT_N)
 
 
 def export_keystore(keypair, seed_bytes):
-    """Prompt user and export encrypted keystore JSON file."""
+    """Prompt user and export encrypted keystore JSON file.
+
+    `keypair` is the lightweight (public_key, ss58_address) namespace from
+    derive_enjin_snap_ed25519; the Web3 format needs only `seed_bytes`.
+    """
     print("Generate JSON keystore file for Enjin Wallet import?")
     if not ask_yes_no("  Export keystore? (y/n): ", default='n'):
         return
@@ -411,12 +543,12 @@ def export_keystore(keypair, seed_bytes):
         except Exception as e:
             print(f"  Error building Web3 keystore: {e}")
             return
-        ts = int(time.time())
+        ts = time.time_ns() // 1_000_000_000
         filename = f"enjin-snap-keystore-web3-{keystore.get('address','unknown')[:8]}-{ts}.json"
         filepath = os.path.join(os.getcwd(), filename)
 
         with open(filepath, 'w') as f:
-            json.dump(keystore, f, indent=2)
+            _json_dump(keystore, f)
 
         print(f"\n  Web3 keystore saved to: {filename}")
         print(f"  Ethereum address: 0x{keystore.get('address', 'unknown')}")
@@ -430,12 +562,12 @@ def export_keystore(keypair, seed_bytes):
 
     # Default: Polkadot-style keystore for Enjin Wallet
     keystore = build_keystore(keypair, seed_bytes, password)
-    ts = int(time.time())
+    ts = time.time_ns() // 1_000_000_000
     filename = f"enjin-snap-keystore-{keypair.ss58_address[:8]}-{ts}.json"
     filepath = os.path.join(os.getcwd(), filename)
 
     with open(filepath, 'w') as f:
-        json.dump(keystore, f, indent=2)
+        _json_dump(keystore, f)
 
     print(f"\n  Keystore saved to: {filename}")
     print(f"  Address: {keypair.ss58_address}")
@@ -446,70 +578,102 @@ def export_keystore(keypair, seed_bytes):
 
 def main():
     """Main entry point — derive addresses and optionally export keystore."""
+    _ensure_deps()
+
     # Suppress urllib3 OpenSSL warnings
     warnings.filterwarnings("ignore", category=UserWarning)
 
     mnemonic = load_mnemonic()
+    from scalecodec.utils.ss58 import ss58_encode
 
-    print("=" * 60)
+    # Each seed costs a PBKDF2-HMAC-SHA512 (2048 rounds) stretch of the
+    # mnemonic; compute each once and share it between derivations. A failed
+    # stretch is re-raised in (and reported by) each section that needs it.
+    bip39_seed = mini_secret = bip39_error = mini_error = None
+    try:
+        bip39_seed = derive_bip39_seed(mnemonic)
+    except Exception as e:
+        bip39_error = e
+    try:
+        mini_secret = derive_sr25519_mini_secret(mnemonic)
+    except Exception as e:
+        mini_error = e
+
+    # Collect the report and write it in one go instead of one print() per
+    # line; errors flush whatever is pending first so ordering is preserved.
+    out = ["=" * 60]
+
+    def flush_out():
+        if out:
+            sys.stdout.write("\n".join(out) + "\n")
+            sys.stdout.flush()
+            out.clear()
 
     # 1. Ethereum address
     try:
-        eth_account = derive_ethereum(mnemonic)
-        print(f"Ethereum (m/44'/60'/0'/0/0):\n  {eth_account.address}")
+        if bip39_error:
+            raise bip39_error
+        eth_account = derive_ethereum(bip39_seed)
+        out.append(f"Ethereum (m/44'/60'/0'/0/0):\n  {eth_account.address}")
     except Exception as e:
+        flush_out()
         print(f"Error generating Ethereum address: {e}")
 
-    print("-" * 60)
+    out.append("-" * 60)
 
     # 2. sr25519 Matrixchain address
     try:
-        sr25519_kp = derive_matrixchain_sr25519(mnemonic)
-        print(f"Matrixchain sr25519 (blank derivation):\n  {sr25519_kp.ss58_address}")
+        if mini_error:
+            raise mini_error
+        sr25519_kp = derive_matrixchain_sr25519(mini_secret)
+        out.append(f"Matrixchain sr25519 (blank derivation):\n  {sr25519_kp.ss58_address}")
     except Exception as e:
+        flush_out()
         print(f"Error generating sr25519 address: {e}")
 
-    print("-" * 60)
+    out.append("-" * 60)
 
     # 3. sr25519 Relaychain address
     try:
-        relay_sr_kp = derive_relaychain_sr25519(mnemonic)
-        print(f"Relaychain sr25519 (blank derivation):\n  {relay_sr_kp.ss58_address}")
+        if mini_error:
+            raise mini_error
+        relay_sr_kp = derive_relaychain_sr25519(mini_secret)
+        out.append(f"Relaychain sr25519 (blank derivation):\n  {relay_sr_kp.ss58_address}")
     except Exception as e:
+        flush_out()
         print(f"Error generating Relaychain sr25519 address: {e}")
 
-    print("-" * 60)
+    out.append("-" * 60)
 
     # 4. Enjin Snap ed25519 address + exports
     try:
-        snap_keypair, seed_bytes = derive_enjin_snap_ed25519(mnemonic)
-        print(f"Enjin Snap ed25519 — Matrixchain (m/44'/1155' seed logic):\n  {snap_keypair.ss58_address}")
+        if bip39_error:
+            raise bip39_error
+        snap_keypair, seed_bytes = derive_enjin_snap_ed25519(bip39_seed)
+        out.append(f"Enjin Snap ed25519 — Matrixchain (m/44'/1155' seed logic):\n  {snap_keypair.ss58_address}")
 
         # Relaychain ed25519 address (same keypair, different SS58 prefix)
-        relay_ed_kp = Keypair.create_from_seed(
-            seed_bytes,
-            ss58_format=SS58_RELAY_FORMAT,
-            crypto_type=KeypairType.ED25519
-        )
-        print(f"Enjin Snap ed25519 — Relaychain (m/44'/1155' seed logic):\n  {relay_ed_kp.ss58_address}")
+        relay_ed_address = ss58_encode(snap_keypair.public_key, SS58_RELAY_FORMAT)
+        out.append(f"Enjin Snap ed25519 — Relaychain (m/44'/1155' seed logic):\n  {relay_ed_address}")
 
-        print(f"Public key: 0x{snap_keypair.public_key.hex()}")
+        out.append(f"Public key: 0x{snap_keypair.public_key.hex()}")
 
-        print("-" * 60)
+        out.append("-" * 60)
 
         # Private key (hex)
         private_key_hex = "0x" + seed_bytes.hex()
-        print(f"Private key (hex seed) for wallet import:\n  {private_key_hex}")
+        out.append(f"Private key (hex seed) for wallet import:\n  {private_key_hex}")
 
-        print("-" * 60)
+        out.append("-" * 60)
 
-        # Keystore export
+        # Keystore export is interactive — show everything derived so far first
+        flush_out()
         export_keystore(snap_keypair, seed_bytes)
     except Exception as e:
+        flush_out()
         print(f"Error generating Enjin Snap address: {e}")
 
     print("=" * 60)
 
-
 if __name__ == "__main__":
     main()